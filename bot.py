@@ -14,7 +14,8 @@ from dotenv import find_dotenv, load_dotenv
 
 load_dotenv(find_dotenv())
 
-from handlers.user_private import user_private_router
+from handlers.user_private import user_private_router, upload_flight, doc_archive
+from middlewares.update_dedup import UpdateDedupMiddleware
 
 
 # --------------------------------------------------------------------------------
@@ -27,6 +28,17 @@ bot.my_admins_list = []
 
 dp = Dispatcher()
 
+update_dedup = UpdateDedupMiddleware()
+dp.update.outer_middleware(update_dedup)
+
+# ---- Как часто печатать счётчики отсеянных дубликатов (секунды) ----
+STATS_INTERVAL = float(os.getenv("STATS_INTERVAL", "600"))
+
+# ---- Как часто удалять истёкшие записи архива документов (секунды) ----
+ARCHIVE_PURGE_INTERVAL = float(os.getenv("ARCHIVE_PURGE_INTERVAL", "3600"))
+
+background_tasks: set[asyncio.Task] = set()
+
 dp.include_router(user_private_router)
 
 
@@ -35,11 +47,30 @@ dp.include_router(user_private_router)
 # --------------------------------------------------------------------------------
 
 
+def print_stats():
+    # ---- Сколько повторных апдейтов и загрузок удалось не выполнять ----
+    for stats in (update_dedup.stats(), upload_flight.stats()):
+        print(stats)
+
+
+async def run_periodically(interval: float, job):
+    while True:
+        await asyncio.sleep(interval)
+        job()
+
+
 async def on_startup(bot):
+    # ---- Записи могли истечь, пока бот был выключен ----
+    doc_archive.purge_expired()
+    background_tasks.add(asyncio.create_task(run_periodically(STATS_INTERVAL, print_stats)))
+    background_tasks.add(asyncio.create_task(run_periodically(ARCHIVE_PURGE_INTERVAL, doc_archive.purge_expired)))
     print("бот запущен")
 
 
 async def on_shutdown(bot):
+    for task in background_tasks:
+        task.cancel()
+    print_stats()
     print("бот лег")
 
 
@@ -9,6 +9,7 @@ hello_text = (
     "Для генерации документа вам нужны файлы с реквизитами исполнителя и заказчика. Чтобы начать генерацию введите: /new.\n"
     "Если у вас есть реквизиты, но нет файла с ними, то я помогу вам его создать. Для этого есть команда: /reqs.\n"
     "Просмотр всех известных мне документов: /docs.\n"
+    "Повторная отправка недавно созданных документов: /history.\n"
     "Просмотр всех доступных команд: /commands.\n"
 )
 
@@ -20,6 +21,7 @@ commands_text = (
     "/docs - выводит список всех доступных документов;\n"
     "/new - запускает процесс создания документа, при активации следуйте инсрукциям;\n"
     "/reqs - запускает процесс создания файла с реквизитами, при активации следуйте инсрукциям;\n"
+    "/history - выводит недавно созданные документы и позволяет получить их повторно;\n"
     "/back - если ввести команду после запуска процесс создания документа или файла с реквизитами, то вы вернётесь на шаг назад;\n"
     "/cancel  - отменяет процесс создания документа или файла с реквизитами, весь процесс стирается."
 )
@@ -28,4 +30,31 @@ commands_text = (
 documents_text = (
     "Бот может генерировать:\n\n"
     "- акт выполныных работ;\n"
-)
\ No newline at end of file
+)
+
+
+# ---- Текст для history ----
+history_text = "Недавно созданные документы. Нажмите на документ, чтобы получить его повторно:"
+
+history_empty_text = "Недавно созданных документов нет. Документы хранятся ограниченное время."
+
+history_expired_text = "Срок хранения документа истёк, создайте его заново."
+
+# ---- Текст для ошибок LLM ----
+llm_circuit_open_text = (
+    "Сервис генерации сейчас недоступен. Попробуйте повторить запрос через пару минут."
+)
+
+llm_unavailable_text = (
+    "Не удалось получить ответ от сервиса генерации. Попробуйте отправить сообщение ещё раз."
+)
+
+llm_busy_text = (
+    "Предыдущий запрос ещё обрабатывается. Дождитесь ответа и отправьте сообщение снова."
+)
+
+resend_client_file_text = "Отправьте файл с реквизитами заказчика ещё раз."
+
+budget_exceeded_text = (
+    "Дневной лимит генерации исчерпан. Попробуйте снова завтра."
+)
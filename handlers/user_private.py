@@ -8,31 +8,42 @@
 import os
 import json
 import uuid
+import shutil
 import mimetypes
 import subprocess
 
 from io import BytesIO
-from typing import Sequence
+from datetime import datetime
+from typing import Any, Awaitable, Callable
 from dataclasses import dataclass, asdict
 
 from aiogram import Bot, types, Router, F
 from aiogram.types import FSInputFile 
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import CommandStart, Command, StateFilter
+from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
-from langchain_core.language_models import LanguageModelLike
-from langchain_core.runnables import RunnableConfig
-from langchain_core.tools import BaseTool, tool
+from langchain_core.tools import tool
 from langchain_gigachat.chat_models import GigaChat
-from langgraph.prebuilt import create_react_agent
-from langgraph.checkpoint.memory import MemorySaver
 
 from common.texts import *
 from common.user_reqs import Requisites
 
 
+from utils.doc_archive import DocumentArchive
 from utils.files_send import send_all_user_files
+from utils.llm_agent import LLMAgent
+from utils.llm_client import (
+    CircuitBreaker,
+    CircuitOpenError,
+    LLMUnavailableError,
+    ResilientLLM,
+    TurnInProgressError,
+)
+from utils.single_flight import SingleFlight
+from utils.usage_meter import BudgetExceededError, UsageMeter
 from utils.reqs_file_generator import generate_requisites_docx_file
 
 # --------------------------------------------------------------------------------
@@ -185,53 +196,38 @@ def generate_pdf_act(customer: Customer, executor: Executor, jobs: list[Job], us
 
 
 # --------------------------------------------------------------------------------
-# Агент
+# Настройки и константы
 # --------------------------------------------------------------------------------
 
 
-class LLMAgent:
-    def __init__(self, model: LanguageModelLike, tools: Sequence[BaseTool]):
-        self._model = model
-        self._agent = create_react_agent(
-            model,
-            tools=tools,
-            checkpointer=MemorySaver())
-        self._config: RunnableConfig = {
-                "configurable": {"thread_id": uuid.uuid4().hex}}
-
-    def upload_file(self, file):
-        print(f"upload file {file} to LLM")
-        file_uploaded_id = self._model.upload_file(file).id_  # type: ignore
-        return file_uploaded_id
-
-    def invoke(
-        self,
-        content: str,
-        attachments: list[str]|None=None,
-        temperature: float=0.1
-    ) -> str:
-        """Отправляет сообщение в чат"""
-        message: dict = {
-            "role": "user",
-            "content": content,
-            **({"attachments": attachments} if attachments else {}) 
-        }
-        return self._agent.invoke(
-            {
-                "messages": [message],
-                "temperature": temperature
-            },
-            config=self._config)["messages"][-1].content
+user_private_router = Router()
 
+TYPST_BIN = os.path.join("typst", "typst.exe")
 
-# --------------------------------------------------------------------------------
-# Настройки и константы
-# --------------------------------------------------------------------------------
+# ---- Таймауты и повторы обращений к GigaChat (секунды) ----
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))  # один HTTP-запрос к GigaChat
+LLM_TURN_TIMEOUT = float(os.getenv("LLM_TURN_TIMEOUT", "180"))  # весь ход агента, несколько запросов
+LLM_UPLOAD_TIMEOUT = float(os.getenv("LLM_UPLOAD_TIMEOUT", "30"))
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "3"))
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "0"))  # 0 — без хеджирования загрузок
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "30"))
 
+# ---- Учёт токенов: база и дневной лимит на пользователя (0 — без лимита) ----
+USAGE_DB_PATH = os.getenv("USAGE_DB_PATH", os.path.join("data", "usage.sqlite3"))
+USER_DAILY_TOKEN_BUDGET = int(os.getenv("USER_DAILY_TOKEN_BUDGET", "0"))
 
-user_private_router = Router()
+usage_meter = UsageMeter(USAGE_DB_PATH, daily_budget=USER_DAILY_TOKEN_BUDGET)
 
-TYPST_BIN = os.path.join("typst", "typst.exe")
+# ---- Архив отправленных документов: храним только file_id и метаданные ----
+DOC_ARCHIVE_DB_PATH = os.getenv("DOC_ARCHIVE_DB_PATH", os.path.join("data", "documents.sqlite3"))
+DOC_ARCHIVE_TTL_HOURS = float(os.getenv("DOC_ARCHIVE_TTL_HOURS", "72"))
+
+doc_archive = DocumentArchive(DOC_ARCHIVE_DB_PATH, ttl=DOC_ARCHIVE_TTL_HOURS * 3600)
+
+# ---- Объединение одновременных одинаковых загрузок.
+# ---- Компиляции не объединяем: ходы одного пользователя и так идут по одному (ResilientLLM) ----
+upload_flight = SingleFlight("uploads")
 
 SYSTEM_PROMPT = (
         "Твоя задача сгенерировать бухгалтерский докумет (пока ты можешь генерировать только акт выполненых работ)"
@@ -259,8 +255,41 @@ SYSTEM_PROMPT = (
 model = GigaChat(
     model="GigaChat-2-Max",
     verify_ssl_certs=False,
+    timeout=LLM_TIMEOUT,
 )
 agent = LLMAgent(model, tools=[generate_pdf_act])
+llm = ResilientLLM(
+    agent,
+    turn_timeout=LLM_TURN_TIMEOUT,
+    upload_timeout=LLM_UPLOAD_TIMEOUT,
+    max_attempts=LLM_MAX_ATTEMPTS,
+    hedge_delay=LLM_HEDGE_DELAY or None,
+    breaker=CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_RESET),
+)
+
+
+# --------------------------------------------------------------------------------
+# Обращение к LLM из обработчиков
+# --------------------------------------------------------------------------------
+
+
+async def call_llm(message: types.Message, user_id: int, call: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Проверяет дневной лимит пользователя и выполняет обращение к LLM.
+    Если лимит исчерпан или провайдер недоступен — отвечает пользователю и возвращает None.
+    """
+    try:
+        usage_meter.check_budget(user_id)
+        return await call()
+    except BudgetExceededError:
+        await message.answer(budget_exceeded_text)
+    except CircuitOpenError:
+        await message.answer(llm_circuit_open_text)
+    except LLMUnavailableError:
+        await message.answer(llm_unavailable_text)
+    except TurnInProgressError:
+        await message.answer(llm_busy_text)
+    return None
 
 
 # --------------------------------------------------------------------------------
@@ -290,6 +319,7 @@ async def documents_cmd(message: types.Message):
 @user_private_router.message(Command("new"))
 async def new_cmd(message: types.Message, state: FSMContext):
     await state.clear()
+    await state.update_data(session_id=uuid.uuid4().hex)
     await message.answer("Отправьте файл с реквизитами исполнителя")
     await state.set_state(ReqFiles.waiting_executor_file)
 
@@ -300,6 +330,47 @@ async def requisites_cmd(message: types.Message, state: FSMContext):
     await state.update_data(step=0)
     await state.set_state(OrgData.collecting)
     await message.answer(f"1️: Введите: {Requisites[0]}")
+
+
+# ---- Команда история (список недавно отправленных документов для повторной отправки) ----
+@user_private_router.message(Command("history"))
+async def history_cmd(message: types.Message):
+    documents = doc_archive.recent(message.from_user.id)
+    if not documents:
+        await message.answer(history_empty_text)
+        return
+
+    keyboard = InlineKeyboardBuilder()
+    for document in documents:
+        created = datetime.fromtimestamp(document["created_at"]).strftime("%d.%m.%Y %H:%M")
+        keyboard.button(text=f"{document['title']} — {created}", callback_data=f"history:{document['id']}")
+    keyboard.adjust(1)
+
+    await message.answer(history_text, reply_markup=keyboard.as_markup())
+
+
+# ---- Повторная отправка документа по сохранённому file_id, без генерации и загрузки ----
+@user_private_router.callback_query(F.data.startswith("history:"))
+async def history_resend(callback: types.CallbackQuery):
+    try:
+        document_id = int(callback.data.split(":", 1)[1])
+    except ValueError:
+        await callback.answer()
+        return
+
+    document = doc_archive.get(callback.from_user.id, document_id)
+    if document is None:
+        await callback.answer(history_expired_text, show_alert=True)
+        return
+
+    # ---- Сообщение с кнопкой старше 48 часов недоступно боту, поэтому пишем напрямую в чат пользователя ----
+    try:
+        await callback.bot.send_document(callback.from_user.id, document["file_id"])
+    except TelegramBadRequest:
+        # ---- Telegram больше не принимает этот file_id ----
+        await callback.answer(history_expired_text, show_alert=True)
+        return
+    await callback.answer()
     
 
 
@@ -318,10 +389,13 @@ class ReqFiles(StatesGroup):
 @user_private_router.message(StateFilter(ReqFiles.waiting_executor_file, ReqFiles.waiting_client_file), F.document)
 async def handle_file(message: types.Message, state: FSMContext, bot):
     current_state = await state.get_state()
+    user_id = message.from_user.id
+    session_id = (await state.get_data()).get("session_id")
 
 
     doc = message.document
     file_id = doc.file_id
+    file_unique_id = doc.file_unique_id
     file_name = doc.file_name
 
     mime_type, _ = mimetypes.guess_type(file_name)
@@ -351,17 +425,31 @@ async def handle_file(message: types.Message, state: FSMContext, bot):
         await message.answer("Сначала отправьте файл с реквизитами")
         return
 
-    # ---- Скачиваем файл в память ----
-    buffer = BytesIO()
-    buffer.name = file_name
+    # ---- Скачиваем файл в память и загружаем в LLM ----
+    async def download_and_upload():
+        buffer = BytesIO()
+        buffer.name = file_name
 
-    file = await bot.get_file(file_id)
-    await bot.download_file(file.file_path, buffer)
-    buffer.seek(0)
+        file = await bot.get_file(file_id)
+        await bot.download_file(file.file_path, buffer)
 
+        return await llm.upload_file(
+            buffer.getvalue(), file_name, on_usage=usage_meter.recorder(user_id, session_id)
+        )
 
-    # ---- Загружаем файл в LLM ----
-    llm_file_id = agent.upload_file(buffer)
+
+    # ---- Один и тот же файл, присланный повторно, пока идёт загрузка, не качаем заново.
+    # ---- Ключ включает user_id: file_id в LLM и расход не делятся между пользователями ----
+    uploaded = await call_llm(
+        message, user_id, lambda: upload_flight.do((user_id, file_unique_id), download_and_upload)
+    )
+    if uploaded is None:
+        return
+
+    # ---- Дубликат: ответы и system_prompt остаются за первым обработчиком ----
+    llm_file_id, leader = uploaded
+    if not leader:
+        return
 
 
     # ---- Сохраняем file_id в FSM ----
@@ -374,21 +462,27 @@ async def handle_file(message: types.Message, state: FSMContext, bot):
         return
     elif next_state == ReqFiles.chatting:
         # Загружаем оба file_id
-        await message.answer(prompt)
         data = await state.get_data()
         my_file_id = data.get("my_file_id")
         client_file_id = data.get("client_file_id")
 
         # ---- Отправляем system_prompt агенту и получаем ответ----
-        agent.invoke(
+        response = await call_llm(message, user_id, lambda: llm.invoke(
+            user_id,
             content=SYSTEM_PROMPT,
-            attachments=[my_file_id, client_file_id]
-        )
-        
+            attachments=[my_file_id, client_file_id],
+            on_usage=usage_meter.recorder(user_id, session_id)
+        ))
+        # ---- Без system_prompt диалог не начнётся: остаёмся в ожидании файла заказчика ----
+        if response is None:
+            await message.answer(resend_client_file_text)
+            return
+
 
 
-        # ---- Переходим в режим диалога и отправляем ответ агента ----
+        # ---- Переходим в режим диалога и просим данные для акта ----
         await state.set_state(ReqFiles.chatting)
+        await message.answer(prompt)
 
 
 
@@ -401,24 +495,53 @@ async def agent_chat(message: types.Message, state: FSMContext, bot: Bot):
     user_id = message.from_user.id
     data = await state.get_data()
     client_reqs_file_id = data.get("client_file_id")
+    session_id = data.get("session_id")
 
 
-    # ---- Вызываем агента, передаём ему данные ----
-    response = agent.invoke(
-        content=f"[USER_ID:{user_id}]\n{message.text}",
-        attachments=[client_reqs_file_id]
-    )
-
-    
     # ---- Создаём путь к папке с файлами ----
     base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     folder_path = os.path.join(base_dir, "typst", str(user_id))
 
+    # ---- Пока жив поток прошлого хода (даже брошенного по таймауту), новый не начинаем ----
+    if llm.turn_in_progress(user_id):
+        await message.answer(llm_busy_text)
+        return
+
+    # ---- Убираем файлы, оставшиеся от прерванного по таймауту хода, чтобы не отправить их с этим ответом ----
+    shutil.rmtree(folder_path, ignore_errors=True)
+
+
+    # ---- Вызываем агента, передаём ему данные ----
+    response = await call_llm(message, user_id, lambda: llm.invoke(
+        user_id,
+        content=f"[USER_ID:{user_id}]\n{message.text}",
+        attachments=[client_reqs_file_id],
+        on_usage=usage_meter.recorder(user_id, session_id)
+    ))
+    if response is None:
+        return
+
 
     # ---- проверка, существует ли директория (она существует только если произошла генерация). Если директории нет, то агент - отвечает на обвчные вопросы ----
     if os.path.isdir(folder_path):
+        # ---- Номер акта берём из JSON до того, как папка будет удалена ----
+        title = "Акт"
+        act_json_path = os.path.join(folder_path, "act.json")
+        if os.path.isfile(act_json_path):
+            with open(act_json_path, "r", encoding="utf-8") as f:
+                title = f"Акт № {json.load(f).get('number', '')}"
+
         await message.answer(response)
-        await send_all_user_files(message, folder_path)
+        delivered = await send_all_user_files(message, folder_path)
+        archive_ids = [
+            doc_archive.add(user_id, file_id, file_name, title)
+            for file_name, file_id in delivered
+        ]
+
+        # ---- Весь расход сессии до этого момента относим к документу.
+        # ---- id — номер записи архива: file_id в базе учёта хранить нельзя, она не очищается по TTL ----
+        if session_id and archive_ids:
+            usage_meter.assign_document(session_id, f"doc-{archive_ids[0]}")
     else:
         await message.answer(response)
 
@@ -460,7 +583,9 @@ async def collect_reqs_data(message: types.Message, state: FSMContext):
         
         # ---- Запускаем создание файла и отправляем его ----
         await generate_requisites_docx_file(data, folder_path)
-        await send_all_user_files(message, folder_path)
+        delivered = await send_all_user_files(message, folder_path)
+        for file_name, file_id in delivered:
+            doc_archive.add(user_id, file_id, file_name, "Файл реквизитов")
         await state.clear()
 
 
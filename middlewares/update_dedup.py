@@ -0,0 +1,49 @@
+# --------------------------------------------------------------------------------
+# Middleware для отсева повторно доставленных апдейтов
+# --------------------------------------------------------------------------------
+# Импорты
+# --------------------------------------------------------------------------------
+
+
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+
+# --------------------------------------------------------------------------------
+# Middleware
+# --------------------------------------------------------------------------------
+
+
+class UpdateDedupMiddleware(BaseMiddleware):
+    """
+    Telegram может доставить один и тот же апдейт повторно. Запоминаем
+    последние max_size update_id и пропускаем повторы мимо обработчиков.
+    """
+
+    def __init__(self, max_size: int = 10_000):
+        self._max_size = max_size
+        self._seen: OrderedDict[int, None] = OrderedDict()
+        self.duplicates = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        if isinstance(event, Update):
+            if event.update_id in self._seen:
+                self.duplicates += 1
+                return None
+
+            self._seen[event.update_id] = None
+            if len(self._seen) > self._max_size:
+                self._seen.popitem(last=False)
+
+        return await handler(event, data)
+
+    def stats(self) -> dict:
+        return {"name": "updates", "duplicates": self.duplicates}
@@ -0,0 +1,78 @@
+# --------------------------------------------------------------------------------
+# Тесты архива отправленных документов
+# --------------------------------------------------------------------------------
+# Импорты
+# --------------------------------------------------------------------------------
+
+
+import os
+
+import pytest
+
+from utils import doc_archive as doc_archive_module
+from utils.doc_archive import DocumentArchive
+
+
+# --------------------------------------------------------------------------------
+# Тесты
+# --------------------------------------------------------------------------------
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = Clock()
+    monkeypatch.setattr(doc_archive_module.time, "time", fake)
+    return fake
+
+
+@pytest.fixture
+def archive(tmp_path, clock):
+    return DocumentArchive(os.path.join(tmp_path, "documents.sqlite3"), ttl=60)
+
+
+def test_get_returns_document_only_to_owner(archive):
+    document_id = archive.add(1, "file-1", "act.pdf", "Акт")
+
+    assert archive.get(1, document_id)["file_id"] == "file-1"
+    assert archive.get(2, document_id) is None
+    assert archive.get(1, document_id + 1) is None
+
+
+def test_recent_is_newest_first_and_limited(archive, clock):
+    for i in range(3):
+        archive.add(1, f"file-{i}", f"act-{i}.pdf", f"Акт {i}")
+        clock.now += 1
+    archive.add(2, "other", "other.pdf", "Чужой")
+
+    assert [document["file_id"] for document in archive.recent(1, limit=2)] == ["file-2", "file-1"]
+
+
+def test_documents_expire_after_ttl(archive, clock):
+    document_id = archive.add(1, "file-1", "act.pdf", "Акт")
+
+    clock.now += 59
+    assert archive.get(1, document_id) is not None
+
+    clock.now += 1
+    assert archive.get(1, document_id) is None
+    assert archive.recent(1) == []
+
+
+def test_purge_removes_expired_rows(archive, clock):
+    archive.add(1, "old", "old.pdf", "Старый")
+    clock.now += 30
+    archive.add(1, "new", "new.pdf", "Новый")
+
+    clock.now += 40
+    archive.purge_expired()
+
+    rows = archive._db.execute("SELECT file_id FROM documents").fetchall()
+    assert [row["file_id"] for row in rows] == ["new"]
@@ -0,0 +1,277 @@
+# --------------------------------------------------------------------------------
+# Тесты LLMAgent и ResilientLLM против локального фейкового сервера GigaChat
+# --------------------------------------------------------------------------------
+# Импорты
+# --------------------------------------------------------------------------------
+
+
+import json
+import time
+import socket
+import struct
+import asyncio
+import threading
+
+from io import BytesIO
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("langchain_gigachat")
+pytest.importorskip("langgraph")
+
+from langchain_gigachat.chat_models import GigaChat
+
+from utils.llm_agent import LLMAgent
+from utils.llm_client import LLMUnavailableError, ResilientLLM, is_transient, is_unsent, status_code
+
+
+# --------------------------------------------------------------------------------
+# Фейковый сервер
+# --------------------------------------------------------------------------------
+
+
+COMPLETION = {
+    "choices": [
+        {"message": {"role": "assistant", "content": "Готово"}, "index": 0, "finish_reason": "stop"}
+    ],
+    "created": 1700000000,
+    "model": "GigaChat-2-Max",
+    "usage": {"prompt_tokens": 120, "completion_tokens": 8, "total_tokens": 128},
+    "object": "chat.completion",
+}
+
+UPLOADED_FILE = {
+    "id": "file-1",
+    "object": "file",
+    "bytes": 10,
+    "created_at": 1700000000,
+    "filename": "reqs.docx",
+    "purpose": "general",
+}
+
+
+class FakeGigaChat:
+    """
+    HTTP-сервер с API GigaChat. Перед запросами можно поставить в очередь сбои:
+    ("delay", секунды) — ответить с задержкой, ("status", код) — вернуть ошибку,
+    ("reset",) — оборвать соединение без ответа.
+    """
+
+    def __init__(self):
+        self.faults: list[tuple] = []
+        self.requests: list[str] = []
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                fake.requests.append(self.path)
+                fault = fake.faults.pop(0) if fake.faults else None
+
+                if fault and fault[0] == "reset":
+                    # ---- SO_LINGER с нулём: close() отправляет RST ----
+                    self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+                    self.close_connection = True
+                    self.connection.close()
+                    return
+                if fault and fault[0] == "delay":
+                    time.sleep(fault[1])
+                if fault and fault[0] == "status":
+                    self._reply(fault[1], {"status": fault[1], "message": "fake error"})
+                    return
+
+                if self.path.endswith("/files"):
+                    self._reply(200, UPLOADED_FILE)
+                else:
+                    self._reply(200, COMPLETION)
+
+            def _reply(self, status: int, body: dict):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def finish(self):
+                try:
+                    super().finish()
+                except (OSError, ValueError):
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self._server.server_port}/api/v1"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def chat_requests(self) -> int:
+        return sum(path.endswith("/chat/completions") for path in self.requests)
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture
+def fake():
+    server = FakeGigaChat()
+    yield server
+    server.close()
+
+
+def make_agent(base_url: str, timeout: float = 2.0) -> LLMAgent:
+    model = GigaChat(
+        base_url=base_url,
+        access_token="fake-token",
+        model="GigaChat-2-Max",
+        verify_ssl_certs=False,
+        timeout=timeout,
+    )
+    return LLMAgent(model, tools=[])
+
+
+def human_messages(agent: LLMAgent, user_id: int) -> int:
+    return sum(message.type == "human" for message in agent._messages(user_id))
+
+
+def closed_port_url() -> str:
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return f"http://127.0.0.1:{port}/api/v1"
+
+
+# --------------------------------------------------------------------------------
+# Агент
+# --------------------------------------------------------------------------------
+
+
+def test_invoke_returns_answer_and_reports_usage(fake):
+    agent = make_agent(fake.base_url)
+    metered = []
+
+    assert agent.invoke(1, "привет", on_usage=metered.append) == "Готово"
+    assert agent.last_turn_progressed(1)
+
+    (usage,) = metered
+    assert usage.steps == 1
+    assert usage.prompt_tokens == 120
+    assert usage.completion_tokens == 8
+
+
+def test_users_have_separate_histories(fake):
+    agent = make_agent(fake.base_url)
+    agent.invoke(1, "первый")
+    agent.invoke(1, "второй")
+    agent.invoke(2, "третий")
+
+    assert human_messages(agent, 1) == 2
+    assert human_messages(agent, 2) == 1
+
+
+def test_upload_file(fake):
+    agent = make_agent(fake.base_url)
+    buffer = BytesIO(b"requisites")
+    buffer.name = "reqs.docx"
+    assert agent.upload_file(buffer) == "file-1"
+
+
+# --------------------------------------------------------------------------------
+# Классификация настоящих ошибок httpx и gigachat
+# --------------------------------------------------------------------------------
+
+
+@pytest.mark.parametrize("status, unsent", [(429, True), (503, True), (500, False), (502, False)])
+def test_provider_error_status_is_read_from_response_error(fake, status, unsent):
+    fake.faults.append(("status", status))
+    agent = make_agent(fake.base_url)
+
+    with pytest.raises(Exception) as info:
+        agent.invoke(1, "привет")
+
+    assert status_code(info.value) == status
+    assert is_transient(info.value)
+    assert is_unsent(info.value) is unsent
+    assert not agent.last_turn_progressed(1)
+
+
+def test_client_error_is_not_transient(fake):
+    fake.faults.append(("status", 400))
+    agent = make_agent(fake.base_url)
+
+    with pytest.raises(Exception) as info:
+        agent.invoke(1, "привет")
+
+    assert status_code(info.value) == 400
+    assert not is_transient(info.value)
+
+
+def test_gigachat_timeout_is_transient_but_may_have_been_processed(fake):
+    fake.faults.append(("delay", 1.0))
+    agent = make_agent(fake.base_url, timeout=0.2)
+
+    with pytest.raises(Exception) as info:
+        agent.invoke(1, "привет")
+
+    assert type(info.value).__module__.startswith("httpx")
+    assert is_transient(info.value)
+    assert not is_unsent(info.value)
+
+
+def test_connection_reset_is_transient_but_may_have_been_processed(fake):
+    fake.faults.append(("reset",))
+    agent = make_agent(fake.base_url)
+
+    with pytest.raises(Exception) as info:
+        agent.invoke(1, "привет")
+
+    assert is_transient(info.value)
+    assert not is_unsent(info.value)
+
+
+def test_connection_refused_is_unsent():
+    agent = make_agent(closed_port_url())
+
+    with pytest.raises(Exception) as info:
+        agent.invoke(1, "привет")
+
+    assert is_unsent(info.value)
+
+
+# --------------------------------------------------------------------------------
+# Повторы через ResilientLLM
+# --------------------------------------------------------------------------------
+
+
+def test_retry_after_429_resumes_turn_without_duplicating_message(fake):
+    fake.faults.append(("status", 429))
+    agent = make_agent(fake.base_url)
+    llm = ResilientLLM(agent, backoff_base=0.001, backoff_max=0.01)
+
+    assert asyncio.run(llm.invoke(1, "привет")) == "Готово"
+    assert fake.chat_requests() == 2
+    assert human_messages(agent, 1) == 1
+
+
+def test_turn_is_not_retried_after_gigachat_timeout(fake):
+    fake.faults.append(("delay", 1.0))
+    agent = make_agent(fake.base_url, timeout=0.2)
+    llm = ResilientLLM(agent, backoff_base=0.001, backoff_max=0.01)
+
+    with pytest.raises(LLMUnavailableError):
+        asyncio.run(llm.invoke(1, "привет"))
+    assert fake.chat_requests() == 1
+
+
+def test_upload_is_retried_after_5xx(fake):
+    fake.faults.append(("status", 502))
+    agent = make_agent(fake.base_url)
+    llm = ResilientLLM(agent, backoff_base=0.001, backoff_max=0.01)
+
+    assert asyncio.run(llm.upload_file(b"requisites", "reqs.docx")) == "file-1"
+    assert sum(path.endswith("/files") for path in fake.requests) == 2
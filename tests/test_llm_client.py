@@ -0,0 +1,320 @@
+# --------------------------------------------------------------------------------
+# Тесты устойчивого клиента LLM на фейковом агенте с задержками и ошибками
+# --------------------------------------------------------------------------------
+# Импорты
+# --------------------------------------------------------------------------------
+
+
+import time
+import asyncio
+import threading
+
+import pytest
+
+from utils.llm_client import (
+    CircuitBreaker,
+    CircuitOpenError,
+    LLMUnavailableError,
+    ResilientLLM,
+    TurnInProgressError,
+)
+
+
+# --------------------------------------------------------------------------------
+# Фейковый провайдер
+# --------------------------------------------------------------------------------
+
+
+class ResponseError(Exception):
+    """Повторяет gigachat.exceptions.ResponseError: (url, status_code, content, headers)"""
+
+    def __init__(self, status_code: int):
+        super().__init__("https://fake/chat/completions", status_code, b"", {})
+
+
+class FakeAgent:
+    """
+    Вместо GigaChat выполняет сценарий: каждый элемент — исключение,
+    которое надо выбросить, или пара (задержка, результат).
+    Последний элемент сценария повторяется для всех следующих вызовов.
+    """
+
+    def __init__(self, *script, progressed: bool = False):
+        self._script = list(script)
+        self._lock = threading.Lock()
+        self.progressed = progressed
+        self.uploads = 0
+        self.invokes = []  # значения resume для каждого вызова
+
+    def _next(self):
+        with self._lock:
+            return self._script.pop(0) if len(self._script) > 1 else self._script[0]
+
+    def _run(self, action, on_usage):
+        if isinstance(action, BaseException):
+            raise action
+        delay, result = action
+        time.sleep(delay)
+        if on_usage:
+            on_usage(result)
+        return result
+
+    def upload_file(self, file, on_usage=None):
+        with self._lock:
+            self.uploads += 1
+        return self._run(self._next(), on_usage)
+
+    def invoke(self, user_id, content, attachments=None, temperature=0.1, resume=False, on_usage=None):
+        with self._lock:
+            self.invokes.append(resume)
+        return self._run(self._next(), on_usage)
+
+    def last_turn_progressed(self, user_id) -> bool:
+        return self.progressed
+
+
+def make_llm(agent, **kwargs) -> ResilientLLM:
+    kwargs.setdefault("backoff_base", 0.001)
+    kwargs.setdefault("backoff_max", 0.01)
+    return ResilientLLM(agent, **kwargs)
+
+
+def upload(llm: ResilientLLM):
+    return asyncio.run(llm.upload_file(b"requisites", "reqs.docx"))
+
+
+def invoke(llm: ResilientLLM):
+    return asyncio.run(llm.invoke(1, "hi"))
+
+
+def timed_upload(llm: ResilientLLM):
+    """
+    Возвращает результат (или исключение) и время ожидания вызывающего.
+    Время меряется внутри event loop: asyncio.run ещё ждёт брошенные потоки.
+    """
+    async def run():
+        started = time.monotonic()
+        try:
+            result = await llm.upload_file(b"requisites", "reqs.docx")
+        except Exception as e:
+            result = e
+        return result, time.monotonic() - started
+
+    return asyncio.run(run())
+
+
+# --------------------------------------------------------------------------------
+# Повторы и задержки
+# --------------------------------------------------------------------------------
+
+
+def test_transient_errors_are_retried_until_success():
+    agent = FakeAgent(ResponseError(503), ConnectionResetError(), (0, "file-1"))
+    assert upload(make_llm(agent)) == "file-1"
+    assert agent.uploads == 3
+
+
+def test_attempts_are_limited():
+    agent = FakeAgent(ResponseError(500))
+    with pytest.raises(LLMUnavailableError):
+        upload(make_llm(agent, max_attempts=3))
+    assert agent.uploads == 3
+
+
+def test_client_error_is_not_retried():
+    agent = FakeAgent(ResponseError(400))
+    llm = make_llm(agent)
+    with pytest.raises(ResponseError):
+        upload(llm)
+    assert agent.uploads == 1
+    assert llm.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_backoff_is_bounded_by_exponential_cap():
+    llm = ResilientLLM(FakeAgent((0, None)), backoff_base=0.5, backoff_max=4.0)
+    for attempt, cap in [(1, 0.5), (2, 1.0), (3, 2.0), (4, 4.0), (10, 4.0)]:
+        for _ in range(50):
+            assert 0 <= llm._backoff(attempt) <= cap
+
+
+def test_upload_deadline():
+    agent = FakeAgent((0.5, "late"))
+    result, elapsed = timed_upload(make_llm(agent, upload_timeout=0.05, max_attempts=2))
+    assert isinstance(result, LLMUnavailableError)
+    assert elapsed < 0.3
+
+
+# --------------------------------------------------------------------------------
+# Ход агента не идемпотентен
+# --------------------------------------------------------------------------------
+
+
+def test_invoke_is_not_retried_after_timeout():
+    agent = FakeAgent((0.3, "late"))
+    with pytest.raises(LLMUnavailableError):
+        invoke(make_llm(agent, turn_timeout=0.05, max_attempts=3))
+    assert agent.invokes == [False]
+
+
+def test_invoke_resumes_when_request_never_reached_provider():
+    agent = FakeAgent(ResponseError(429), (0, "answer"))
+    assert invoke(make_llm(agent)) == "answer"
+    assert agent.invokes == [False, True]
+
+
+def test_invoke_is_not_retried_after_agent_step():
+    agent = FakeAgent(ResponseError(503), progressed=True)
+    with pytest.raises(LLMUnavailableError):
+        invoke(make_llm(agent))
+    assert agent.invokes == [False]
+
+
+def test_invoke_is_not_retried_after_connection_reset():
+    agent = FakeAgent(ConnectionResetError())
+    with pytest.raises(LLMUnavailableError):
+        invoke(make_llm(agent))
+    assert agent.invokes == [False]
+
+
+# --------------------------------------------------------------------------------
+# Ходы одного пользователя идут по одному
+# --------------------------------------------------------------------------------
+
+
+def test_concurrent_turn_of_same_user_is_refused():
+    agent = FakeAgent((0.1, "answer"))
+    llm = make_llm(agent)
+
+    async def run():
+        return await asyncio.gather(
+            llm.invoke(1, "first"), llm.invoke(1, "second"), llm.invoke(2, "other"),
+            return_exceptions=True,
+        )
+
+    first, second, other = asyncio.run(run())
+    assert first == "answer"
+    assert isinstance(second, TurnInProgressError)
+    assert other == "answer"
+
+
+def test_timed_out_turn_keeps_user_busy_until_thread_finishes():
+    agent = FakeAgent((0.3, "late"), (0, "answer"))
+    llm = make_llm(agent, turn_timeout=0.05)
+
+    async def run():
+        with pytest.raises(LLMUnavailableError):
+            await llm.invoke(1, "slow")
+
+        # ---- Поток брошенного хода ещё пишет историю пользователя ----
+        assert llm.turn_in_progress(1)
+        with pytest.raises(TurnInProgressError):
+            await llm.invoke(1, "next")
+        assert not llm.turn_in_progress(2)
+
+        await asyncio.sleep(0.4)
+        assert not llm.turn_in_progress(1)
+        return await llm.invoke(1, "next")
+
+    assert asyncio.run(run()) == "answer"
+    assert agent.invokes == [False, False]
+
+
+# --------------------------------------------------------------------------------
+# Хеджирование
+# --------------------------------------------------------------------------------
+
+
+def test_hedging_is_off_by_default():
+    agent = FakeAgent((0.1, "file-1"))
+    assert upload(make_llm(agent)) == "file-1"
+    assert agent.uploads == 1
+
+
+def test_hedge_takes_first_successful_result():
+    agent = FakeAgent((0.5, "slow"), (0, "fast"))
+    result, elapsed = timed_upload(make_llm(agent, hedge_delay=0.05))
+    assert result == "fast"
+    assert elapsed < 0.3
+    assert agent.uploads == 2
+
+
+def test_losing_hedge_attempt_is_metered():
+    agent = FakeAgent((0.2, "slow"), (0, "fast"))
+    metered = []
+
+    async def run():
+        llm = make_llm(agent, hedge_delay=0.05)
+        result = await llm.upload_file(b"requisites", "reqs.docx", on_usage=metered.append)
+        await asyncio.sleep(0.3)
+        return result
+
+    assert asyncio.run(run()) == "fast"
+    assert sorted(metered) == ["fast", "slow"]
+
+
+def test_hedge_survives_failed_primary():
+    agent = FakeAgent(ResponseError(502), (0, "fast"))
+    assert upload(make_llm(agent, hedge_delay=0.05)) == "fast"
+
+
+# --------------------------------------------------------------------------------
+# Предохранитель
+# --------------------------------------------------------------------------------
+
+
+def test_breaker_open_half_open_closed():
+    agent = FakeAgent(ResponseError(503), ResponseError(503), (0, "file-1"))
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    llm = make_llm(agent, max_attempts=1, breaker=breaker)
+
+    for _ in range(2):
+        with pytest.raises(LLMUnavailableError):
+            upload(llm)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # ---- Пока цепь разомкнута, провайдер не вызывается ----
+    with pytest.raises(CircuitOpenError):
+        upload(llm)
+    assert agent.uploads == 2
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+
+    # ---- Пробный запрос успешен — цепь замыкается ----
+    breaker.state = CircuitBreaker.OPEN
+    assert upload(llm) == "file-1"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_failed_probe_reopens_breaker():
+    agent = FakeAgent(ResponseError(503))
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    llm = make_llm(agent, max_attempts=1, breaker=breaker)
+
+    with pytest.raises(LLMUnavailableError):
+        upload(llm)
+    time.sleep(0.06)
+    with pytest.raises(LLMUnavailableError):
+        upload(llm)
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        upload(llm)
+
+
+def test_local_error_does_not_close_half_open_breaker():
+    agent = FakeAgent(ResponseError(503), ValueError("bug"), (0, "file-1"))
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    llm = make_llm(agent, max_attempts=1, breaker=breaker)
+
+    with pytest.raises(LLMUnavailableError):
+        upload(llm)
+    time.sleep(0.06)
+    with pytest.raises(ValueError):
+        upload(llm)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # ---- Следующий вызов снова становится пробным ----
+    assert upload(llm) == "file-1"
+    assert breaker.state == CircuitBreaker.CLOSED
@@ -0,0 +1,103 @@
+# --------------------------------------------------------------------------------
+# Тесты single-flight
+# --------------------------------------------------------------------------------
+# Импорты
+# --------------------------------------------------------------------------------
+
+
+import asyncio
+
+import pytest
+
+from utils.single_flight import SingleFlight
+
+
+# --------------------------------------------------------------------------------
+# Тесты
+# --------------------------------------------------------------------------------
+
+
+def test_followers_wait_for_leader_result():
+    flight = SingleFlight("test")
+    runs = 0
+
+    async def work():
+        nonlocal runs
+        runs += 1
+        await asyncio.sleep(0.05)
+        return "file-1"
+
+    async def run():
+        return await asyncio.gather(*[flight.do("key", work) for _ in range(3)])
+
+    results = asyncio.run(run())
+    assert runs == 1
+    assert [result for result, _ in results] == ["file-1"] * 3
+    assert [leader for _, leader in results].count(True) == 1
+    assert flight.stats() == {"name": "test", "calls": 1, "coalesced": 2}
+
+
+def test_different_keys_are_not_coalesced():
+    flight = SingleFlight("test")
+
+    async def work():
+        await asyncio.sleep(0.01)
+        return "ok"
+
+    async def run():
+        return await asyncio.gather(flight.do((1, "file"), work), flight.do((2, "file"), work))
+
+    assert asyncio.run(run()) == [("ok", True), ("ok", True)]
+    assert flight.coalesced == 0
+
+
+def test_error_is_propagated_to_followers():
+    flight = SingleFlight("test")
+
+    async def work():
+        await asyncio.sleep(0.05)
+        raise ValueError("upload failed")
+
+    async def run():
+        return await asyncio.gather(*[flight.do("key", work) for _ in range(3)], return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flight.calls == 1
+
+
+def test_result_is_not_cached_after_completion():
+    flight = SingleFlight("test")
+    runs = 0
+
+    async def work():
+        nonlocal runs
+        runs += 1
+        return runs
+
+    async def run():
+        first = await flight.do("key", work)
+        second = await flight.do("key", work)
+        return first, second
+
+    assert asyncio.run(run()) == ((1, True), (2, True))
+
+
+def test_cancelled_follower_does_not_cancel_leader():
+    flight = SingleFlight("test")
+
+    async def work():
+        await asyncio.sleep(0.05)
+        return "ok"
+
+    async def run():
+        leader = asyncio.create_task(flight.do("key", work))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.do("key", work))
+        await asyncio.sleep(0)
+        follower.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await follower
+        return await leader
+
+    assert asyncio.run(run()) == ("ok", True)
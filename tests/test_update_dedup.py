@@ -0,0 +1,49 @@
+# --------------------------------------------------------------------------------
+# Тесты отсева повторно доставленных апдейтов
+# --------------------------------------------------------------------------------
+# Импорты
+# --------------------------------------------------------------------------------
+
+
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiogram")
+
+from aiogram.types import Update
+
+from middlewares.update_dedup import UpdateDedupMiddleware
+
+
+# --------------------------------------------------------------------------------
+# Тесты
+# --------------------------------------------------------------------------------
+
+
+def feed(middleware: UpdateDedupMiddleware, update_ids: list[int]) -> list[int]:
+    """Прогоняет апдейты через middleware и возвращает те, что дошли до обработчика"""
+    handled = []
+
+    async def handler(event, data):
+        handled.append(event.update_id)
+
+    async def run():
+        for update_id in update_ids:
+            await middleware(handler, Update(update_id=update_id), {})
+
+    asyncio.run(run())
+    return handled
+
+
+def test_duplicate_update_is_dropped():
+    middleware = UpdateDedupMiddleware()
+    assert feed(middleware, [1, 2, 1, 3, 2]) == [1, 2, 3]
+    assert middleware.stats() == {"name": "updates", "duplicates": 2}
+
+
+def test_oldest_update_ids_are_evicted():
+    middleware = UpdateDedupMiddleware(max_size=2)
+    # ---- 1 вытеснен после 3, поэтому снова проходит; 3 ещё помнится ----
+    assert feed(middleware, [1, 2, 3, 1, 3]) == [1, 2, 3, 1]
+    assert middleware.duplicates == 1
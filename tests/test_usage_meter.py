@@ -0,0 +1,106 @@
+# --------------------------------------------------------------------------------
+# Тесты учёта токенов
+# --------------------------------------------------------------------------------
+# Импорты
+# --------------------------------------------------------------------------------
+
+
+import os
+import threading
+
+from types import SimpleNamespace
+
+import pytest
+
+from utils.usage_meter import BudgetExceededError, Usage, UsageMeter, usage_from_messages
+
+
+# --------------------------------------------------------------------------------
+# Тесты
+# --------------------------------------------------------------------------------
+
+
+def ai(input_tokens: int, output_tokens: int, precached: int = 0) -> SimpleNamespace:
+    return SimpleNamespace(
+        type="ai",
+        usage_metadata={"input_tokens": input_tokens, "output_tokens": output_tokens},
+        response_metadata={"token_usage": {"precached_prompt_tokens": precached}},
+    )
+
+
+def test_usage_is_summed_over_agent_steps():
+    messages = [ai(100, 20, precached=30), SimpleNamespace(type="tool"), ai(150, 10)]
+    usage = usage_from_messages(messages, attachments=2, latency_ms=50)
+
+    assert (usage.prompt_tokens, usage.completion_tokens, usage.precached_tokens) == (250, 30, 30)
+    assert usage.steps == 2
+    assert usage.total_tokens == 280
+
+
+def test_check_budget(tmp_path):
+    meter = UsageMeter(os.path.join(tmp_path, "usage.sqlite3"), daily_budget=300)
+    meter.record(Usage("invoke", prompt_tokens=200, completion_tokens=50), user_id=1)
+    meter.check_budget(1)
+
+    meter.record(Usage("invoke", prompt_tokens=40, completion_tokens=10), user_id=1)
+    with pytest.raises(BudgetExceededError):
+        meter.check_budget(1)
+
+    # ---- Лимит считается по каждому пользователю отдельно ----
+    meter.check_budget(2)
+
+
+def test_unlimited_budget(tmp_path):
+    meter = UsageMeter(os.path.join(tmp_path, "usage.sqlite3"))
+    meter.record(Usage("invoke", prompt_tokens=10**9), user_id=1)
+    meter.check_budget(1)
+
+
+def test_assign_document_and_totals(tmp_path):
+    meter = UsageMeter(os.path.join(tmp_path, "usage.sqlite3"))
+    meter.record(Usage("upload", attachments=1, attachment_bytes=10), user_id=1, session_id="s1")
+    meter.record(Usage("invoke", prompt_tokens=100, completion_tokens=20), user_id=1, session_id="s1")
+    meter.assign_document("s1", "doc-1")
+
+    # ---- Расход после документа относится уже к следующему ----
+    meter.record(Usage("invoke", prompt_tokens=50, completion_tokens=5), user_id=1, session_id="s1")
+    meter.assign_document("s1", "doc-2")
+    meter.record(Usage("invoke", prompt_tokens=7), user_id=2, session_id="s2")
+
+    by_document = {row["document_id"]: row for row in meter.totals("document_id")}
+    assert set(by_document) == {"doc-1", "doc-2"}
+    assert by_document["doc-1"]["calls"] == 2
+    assert by_document["doc-1"]["prompt_tokens"] == 100
+    assert by_document["doc-1"]["attachment_bytes"] == 10
+    assert by_document["doc-2"]["prompt_tokens"] == 50
+
+    by_user = meter.totals("user_id")
+    assert [(row["user_id"], row["prompt_tokens"]) for row in by_user] == [(1, 150), (2, 7)]
+
+    with pytest.raises(ValueError):
+        meter.totals("kind")
+
+
+def test_record_from_agent_threads(tmp_path):
+    meter = UsageMeter(os.path.join(tmp_path, "usage.sqlite3"))
+    record = meter.recorder(1, "s1")
+
+    threads = [threading.Thread(target=record, args=(Usage("invoke", prompt_tokens=1),)) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert meter.tokens_today(1) == 10
+
+
+def test_export_csv(tmp_path):
+    meter = UsageMeter(os.path.join(tmp_path, "usage.sqlite3"))
+    meter.record(Usage("invoke", prompt_tokens=3), user_id=1, session_id="s1")
+    path = os.path.join(tmp_path, "usage.csv")
+    meter.export_csv(path)
+
+    with open(path, encoding="utf-8") as f:
+        header, row = f.read().splitlines()
+    assert header.startswith("ts,user_id,session_id,document_id,kind,prompt_tokens")
+    assert ",1,s1,,invoke,3," in row
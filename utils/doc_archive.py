@@ -0,0 +1,79 @@
+# --------------------------------------------------------------------------------
+# Архив отправленных документов
+# --------------------------------------------------------------------------------
+# Импорты
+# --------------------------------------------------------------------------------
+
+
+import os
+import time
+import sqlite3
+
+
+# --------------------------------------------------------------------------------
+# Хранилище
+# --------------------------------------------------------------------------------
+
+
+class DocumentArchive:
+    """
+    Хранит метаданные отправленных документов и их Telegram file_id, чтобы
+    повторно отправлять их без генерации и загрузки. Сами файлы не хранятся.
+    Записи старше ttl секунд удаляются, чтобы не держать персональные данные.
+    """
+
+    def __init__(self, db_path: str, ttl: float):
+        self._ttl = ttl
+
+        folder = os.path.dirname(db_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        self._db = sqlite3.connect(db_path)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                file_id TEXT NOT NULL,
+                file_name TEXT NOT NULL,
+                title TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL
+            )
+            """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS documents_user ON documents (user_id, created_at)")
+        self._db.commit()
+
+    def add(self, user_id: int, file_id: str, file_name: str, title: str) -> int:
+        """Возвращает id записи — он не раскрывает file_id и годится как ссылка на документ"""
+        now = time.time()
+        self.purge_expired()
+        cursor = self._db.execute(
+            "INSERT INTO documents (user_id, file_id, file_name, title, created_at, expires_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (user_id, file_id, file_name, title, now, now + self._ttl),
+        )
+        self._db.commit()
+        return cursor.lastrowid
+
+    def recent(self, user_id: int, limit: int = 10) -> list[dict]:
+        self.purge_expired()
+        rows = self._db.execute(
+            "SELECT * FROM documents WHERE user_id = ? ORDER BY created_at DESC LIMIT ?",
+            (user_id, limit),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def get(self, user_id: int, document_id: int) -> dict | None:
+        """Возвращает запись только её владельцу и только пока она не истекла"""
+        row = self._db.execute(
+            "SELECT * FROM documents WHERE id = ? AND user_id = ? AND expires_at > ?",
+            (document_id, user_id, time.time()),
+        ).fetchone()
+        return dict(row) if row else None
+
+    def purge_expired(self) -> None:
+        self._db.execute("DELETE FROM documents WHERE expires_at <= ?", (time.time(),))
+        self._db.commit()
@@ -18,14 +18,19 @@ from aiogram.types import FSInputFile
 # --------------------------------------------------------------------------------
 
 
-async def send_all_user_files(message: types.Message, folder_path: str):
+async def send_all_user_files(message: types.Message, folder_path: str) -> list[tuple[str, str]]:
+    """Отправляет pdf и docx файлы из папки и возвращает пары (имя файла, Telegram file_id)"""
+    delivered = []
     for filename in os.listdir(folder_path):
         # ---- Проверяем является ли файл в папке pdf файлом и отправляем его ----
         if filename.lower().endswith(".pdf"):
             file_path = os.path.join(folder_path, filename)
-            await message.answer_document(FSInputFile(file_path))
+            sent = await message.answer_document(FSInputFile(file_path))
+            delivered.append((filename, sent.document.file_id))
         if filename.lower().endswith(".docx"):
             file_path = os.path.join(folder_path, filename)
-            await message.answer_document(FSInputFile(file_path))
+            sent = await message.answer_document(FSInputFile(file_path))
+            delivered.append((filename, sent.document.file_id))
     # ---- По окончании процесса удаляем папку, чтобы не хранить персональные данные ----
-    shutil.rmtree(folder_path)
\ No newline at end of file
+    shutil.rmtree(folder_path)
+    return delivered
\ No newline at end of file
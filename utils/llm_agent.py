@@ -0,0 +1,117 @@
+# --------------------------------------------------------------------------------
+# Агент на LangGraph поверх GigaChat
+# --------------------------------------------------------------------------------
+# Импорты
+# --------------------------------------------------------------------------------
+
+
+import time
+
+from typing import Callable, Sequence
+
+from langchain_core.language_models import LanguageModelLike
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import BaseTool
+from langgraph.prebuilt import create_react_agent
+from langgraph.checkpoint.memory import MemorySaver
+
+from utils.usage_meter import Usage, usage_from_messages
+
+
+# --------------------------------------------------------------------------------
+# Агент
+# --------------------------------------------------------------------------------
+
+
+class LLMAgent:
+    """
+    У каждого пользователя своя история в MemorySaver (thread_id = user_id).
+    Ходы одного пользователя не должны идти параллельно — это обеспечивает ResilientLLM.
+    """
+
+    def __init__(self, model: LanguageModelLike, tools: Sequence[BaseTool]):
+        self._model = model
+        self._agent = create_react_agent(
+            model,
+            tools=tools,
+            checkpointer=MemorySaver())
+
+    def _config(self, user_id: int) -> RunnableConfig:
+        return {"configurable": {"thread_id": f"user-{user_id}"}}
+
+    def upload_file(self, file, on_usage: Callable[[Usage], None]|None=None) -> str:
+        """
+        Загружает файл в LLM. on_usage вызывается по завершении загрузки,
+        даже если её результат уже никому не нужен (таймаут, проигравший хедж).
+        """
+        print(f"upload file {file} to LLM")
+        started = time.perf_counter()
+        file_uploaded_id = self._model.upload_file(file).id_  # type: ignore
+        if on_usage:
+            on_usage(Usage(
+                kind="upload",
+                attachments=1,
+                attachment_bytes=len(file.getvalue()),
+                latency_ms=int((time.perf_counter() - started) * 1000),
+            ))
+        return file_uploaded_id
+
+    def invoke(
+        self,
+        user_id: int,
+        content: str,
+        attachments: list[str]|None=None,
+        temperature: float=0.1,
+        resume: bool=False,
+        on_usage: Callable[[Usage], None]|None=None
+    ) -> str:
+        """
+        Отправляет сообщение в чат пользователя.
+        resume=True продолжает прерванный ход с последнего сохранённого шага,
+        не добавляя сообщение в историю повторно.
+        on_usage получает расход всех шагов модели, сделанных этим вызовом,
+        в том числе если вызов упал или его результат уже не ждут.
+        """
+        config = self._config(user_id)
+        message: dict = {
+            "role": "user",
+            "content": content,
+            **({"attachments": attachments} if attachments else {})
+        }
+        payload = {
+            "messages": [message],
+            "temperature": temperature
+        }
+        if resume and self._agent.get_state(config).next:
+            payload = None
+
+        # ---- Расход считаем по сообщениям, которые выдал именно этот вызов ----
+        produced: list = []
+        started = time.perf_counter()
+        try:
+            for update in self._agent.stream(payload, config=config, stream_mode="updates"):
+                for node_output in update.values():
+                    if isinstance(node_output, dict):
+                        produced.extend(node_output.get("messages", []))
+        finally:
+            if on_usage:
+                on_usage(usage_from_messages(
+                    produced,
+                    attachments=0 if payload is None else len(attachments or []),
+                    latency_ms=int((time.perf_counter() - started) * 1000),
+                ))
+
+        answers = [reply for reply in produced if getattr(reply, "type", None) == "ai"]
+        return (answers[-1] if answers else self._messages(user_id)[-1]).content
+
+    def _messages(self, user_id: int) -> list:
+        return self._agent.get_state(self._config(user_id)).values.get("messages", [])
+
+    def last_turn_progressed(self, user_id: int) -> bool:
+        """Успела ли модель ответить хотя бы на один шаг после последнего сообщения пользователя"""
+        for message in reversed(self._messages(user_id)):
+            if message.type == "human":
+                return False
+            if message.type == "ai":
+                return True
+        return False
@@ -0,0 +1,330 @@
+# --------------------------------------------------------------------------------
+# Устойчивый клиент для обращений к LLM
+# --------------------------------------------------------------------------------
+# Импорты
+# --------------------------------------------------------------------------------
+
+
+import time
+import random
+import asyncio
+
+from io import BytesIO
+from typing import Any, Callable
+
+
+# --------------------------------------------------------------------------------
+# Исключения
+# --------------------------------------------------------------------------------
+
+
+class CircuitOpenError(Exception):
+    """Провайдер признан недоступным, запрос не отправлялся"""
+
+
+class LLMUnavailableError(Exception):
+    """Все попытки обращения к провайдеру исчерпаны"""
+
+
+class TurnInProgressError(Exception):
+    """Предыдущий ход агента для этого пользователя ещё выполняется"""
+
+
+# --------------------------------------------------------------------------------
+# Предохранитель (circuit breaker)
+# --------------------------------------------------------------------------------
+
+
+class CircuitBreaker:
+    """
+    Считает подряд идущие сбои провайдера. После failure_threshold сбоев
+    размыкается и reset_timeout секунд сразу отклоняет запросы, затем
+    пропускает один пробный запрос: успех замыкает цепь, сбой снова размыкает.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = 0.0
+        self.state = self.CLOSED
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self._opened_at >= self._reset_timeout:
+            # ---- Пропускаем один пробный запрос, остальные ждут его результата ----
+            self.state = self.HALF_OPEN
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self.state = self.CLOSED
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self.state == self.HALF_OPEN or self._failures >= self._failure_threshold:
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+
+    def record_inconclusive(self) -> None:
+        """Пробный запрос упал не из-за провайдера: следующий вызов снова станет пробным"""
+        if self.state == self.HALF_OPEN:
+            self.state = self.OPEN
+
+
+# --------------------------------------------------------------------------------
+# Классификация ошибок
+# --------------------------------------------------------------------------------
+
+
+def status_code(exc: BaseException) -> int | None:
+    status = getattr(exc, "status_code", None)
+    # ---- gigachat.exceptions.ResponseError: (url, status_code, content, headers) ----
+    args = getattr(exc, "args", ())
+    if status is None and len(args) >= 2 and isinstance(args[1], int):
+        status = args[1]
+    return status
+
+
+def is_transient(exc: BaseException) -> bool:
+    """Сбой на стороне провайдера или сети: таймауты, обрывы соединения, 429 и 5xx"""
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+
+    status = status_code(exc)
+    if status is not None:
+        return status == 429 or status >= 500
+
+    return type(exc).__module__.split(".")[0] in ("httpx", "httpcore")
+
+
+def is_unsent(exc: BaseException) -> bool:
+    """Запрос гарантированно не был обработан провайдером: не удалось соединиться, 429 или 503"""
+    if isinstance(exc, ConnectionRefusedError):
+        return True
+
+    status = status_code(exc)
+    if status is not None:
+        return status in (429, 503)
+
+    return (
+        type(exc).__module__.split(".")[0] in ("httpx", "httpcore")
+        and type(exc).__name__ in ("ConnectError", "ConnectTimeout")
+    )
+
+
+def is_client_error(exc: BaseException) -> bool:
+    """Провайдер ответил 4xx: он доступен, ошибка в самом запросе"""
+    status = status_code(exc)
+    return status is not None and 400 <= status < 500 and status != 429
+
+
+# --------------------------------------------------------------------------------
+# Потоки
+# --------------------------------------------------------------------------------
+
+
+def _thread_task(fn: Callable[..., Any], *args: Any) -> asyncio.Future:
+    """Запускает fn в потоке; ошибку брошенной задачи забираем, чтобы asyncio не ругался"""
+    task = asyncio.ensure_future(asyncio.to_thread(fn, *args))
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    return task
+
+
+# --------------------------------------------------------------------------------
+# Клиент
+# --------------------------------------------------------------------------------
+
+
+class ResilientLLM:
+    """
+    Обёртка над LLMAgent: дедлайн на каждый вызов, ограниченное число повторов
+    с экспоненциальной задержкой и джиттером, необязательное хеджирование
+    загрузки файлов и предохранитель, который при недоступности провайдера
+    сразу отказывает.
+
+    Синхронные методы агента выполняются в отдельном потоке, поэтому обработчики
+    не блокируют event loop. Поток по таймауту прервать нельзя, поэтому ход
+    агента после таймаута не повторяется: брошенный поток продолжает работать
+    с той же историей. Ход повторяется, только если запрос точно не дошёл до
+    провайдера и модель ещё не сделала ни одного шага.
+
+    Ходы одного пользователя идут строго по одному: пока поток предыдущего хода
+    жив (в том числе брошенный по таймауту), новый ход отклоняется.
+    """
+
+    def __init__(
+        self,
+        agent,
+        *,
+        turn_timeout: float = 180.0,
+        upload_timeout: float = 30.0,
+        max_attempts: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        hedge_delay: float | None = None,
+        breaker: CircuitBreaker | None = None,
+    ):
+        self._agent = agent
+        self._turn_timeout = turn_timeout
+        self._upload_timeout = upload_timeout
+        self._max_attempts = max(1, max_attempts)
+        self._backoff_base = backoff_base
+        self._backoff_max = backoff_max
+        self._hedge_delay = hedge_delay
+        self.breaker = breaker or CircuitBreaker()
+        self._busy_users: set[int] = set()
+
+    def turn_in_progress(self, user_id: int) -> bool:
+        return user_id in self._busy_users
+
+    async def invoke(
+        self,
+        user_id: int,
+        content: str,
+        attachments: list[str]|None=None,
+        temperature: float=0.1,
+        on_usage: Callable[[Any], None]|None=None
+    ) -> str:
+        """
+        Отправляет сообщение в чат. Агент хранит историю, поэтому вызов не хеджируется.
+        on_usage передаётся агенту и вызывается для каждой завершившейся попытки.
+        """
+        def attempt(number: int):
+            # ---- Повтор продолжает ход с сохранённого состояния, не дублируя сообщение ----
+            return self._agent.invoke(
+                user_id, content, attachments, temperature, resume=number > 1, on_usage=on_usage
+            )
+
+        def retryable(exc: BaseException) -> bool:
+            return is_unsent(exc) and not self._agent.last_turn_progressed(user_id)
+
+        if user_id in self._busy_users:
+            raise TurnInProgressError()
+        self._busy_users.add(user_id)
+
+        running: list[asyncio.Future] = []
+        try:
+            return await self._call(
+                attempt, timeout=self._turn_timeout, retryable=retryable, running=running
+            )
+        finally:
+            self._release_when_done(user_id, running)
+
+    def _release_when_done(self, user_id: int, running: list[asyncio.Future]) -> None:
+        """Снимает занятость пользователя, только когда завершились все потоки его хода"""
+        pending = [task for task in running if not task.done()]
+        if not pending:
+            self._busy_users.discard(user_id)
+            return
+        asyncio.gather(*pending, return_exceptions=True).add_done_callback(
+            lambda _: self._busy_users.discard(user_id)
+        )
+
+    async def upload_file(
+        self,
+        data: bytes,
+        file_name: str,
+        on_usage: Callable[[Any], None]|None=None
+    ) -> str:
+        """
+        Загружает файл в LLM. Каждая попытка читает собственный буфер,
+        расход каждой завершившейся попытки уходит в on_usage.
+        """
+        def attempt(number: int):
+            buffer = BytesIO(data)
+            buffer.name = file_name
+            return self._agent.upload_file(buffer, on_usage=on_usage)
+
+        return await self._call(attempt, timeout=self._upload_timeout, hedge=True)
+
+    # ---- Задержка перед повтором: full jitter ----
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self._backoff_max, self._backoff_base * 2 ** (attempt - 1)))
+
+    async def _call(
+        self,
+        fn: Callable[[int], Any],
+        timeout: float,
+        hedge: bool = False,
+        retryable: Callable[[BaseException], bool] = is_transient,
+        running: list[asyncio.Future] | None = None,
+    ) -> Any:
+        if not self.breaker.allow():
+            raise CircuitOpenError()
+
+        last_exc: BaseException | None = None
+        for attempt in range(1, self._max_attempts + 1):
+            try:
+                if hedge and self._hedge_delay:
+                    result = await self._hedged(lambda: fn(attempt), timeout)
+                else:
+                    # ---- shield: по таймауту перестаём ждать, но задача живёт до конца потока ----
+                    task = _thread_task(fn, attempt)
+                    if running is not None:
+                        running.append(task)
+                    result = await asyncio.wait_for(asyncio.shield(task), timeout)
+            except Exception as e:
+                if not is_transient(e):
+                    # ---- 4xx — провайдер жив; прочие ошибки о его состоянии ничего не говорят ----
+                    if is_client_error(e):
+                        self.breaker.record_success()
+                    else:
+                        self.breaker.record_inconclusive()
+                    raise
+                last_exc = e
+                self.breaker.record_failure()
+                print(f"LLM call failed (attempt {attempt}/{self._max_attempts}): {e!r}")
+                if (
+                    attempt == self._max_attempts
+                    or self.breaker.state == CircuitBreaker.OPEN
+                    or not retryable(e)
+                ):
+                    break
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+
+            self.breaker.record_success()
+            return result
+
+        raise LLMUnavailableError() from last_exc
+
+    async def _hedged(self, fn: Callable[[], Any], timeout: float) -> Any:
+        """
+        Запускает вызов, а если за hedge_delay ответа нет — дублирует его
+        и берёт первый успешный результат. Общий дедлайн — timeout.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+
+        tasks = {_thread_task(fn)}
+        done, _ = await asyncio.wait(tasks, timeout=min(self._hedge_delay, timeout))
+        if not done:
+            tasks.add(_thread_task(fn))
+
+        last_exc: BaseException | None = None
+        try:
+            while tasks:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                done, tasks = await asyncio.wait(
+                    tasks, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    raise asyncio.TimeoutError()
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    last_exc = task.exception()
+            raise last_exc
+        finally:
+            for task in tasks:
+                task.cancel()
+
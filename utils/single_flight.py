@@ -0,0 +1,63 @@
+# --------------------------------------------------------------------------------
+# Single-flight: объединение одновременных одинаковых вызовов
+# --------------------------------------------------------------------------------
+# Импорты
+# --------------------------------------------------------------------------------
+
+
+import asyncio
+
+from typing import Any, Awaitable, Callable, Hashable
+
+
+# --------------------------------------------------------------------------------
+# Класс
+# --------------------------------------------------------------------------------
+
+
+class SingleFlight:
+    """
+    Пока вызов с ключом key выполняется, повторные вызовы с тем же ключом
+    не запускают работу заново, а дожидаются результата (или ошибки) первого.
+    Результат не кэшируется: после завершения следующий вызов снова выполняется.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0  # сколько раз работа реально выполнялась
+        self.coalesced = 0  # сколько вызовов дождались чужого результата
+        self._futures: dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> tuple[Any, bool]:
+        """
+        Возвращает (результат, leader). leader=False — вызов дождался чужого
+        результата, и продолжение работы (ответы пользователю, следующие шаги)
+        остаётся за первым вызовом.
+        """
+        future = self._futures.get(key)
+        if future is not None:
+            self.coalesced += 1
+            # ---- shield: отмена одного ожидающего не должна отменять общий вызов ----
+            return await asyncio.shield(future), False
+
+        future = asyncio.get_running_loop().create_future()
+        self._futures[key] = future
+        self.calls += 1
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # ---- Если ошибку никто не ждал, не даём asyncio ругаться на неё ----
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result, True
+        finally:
+            del self._futures[key]
+
+    def stats(self) -> dict:
+        return {"name": self.name, "calls": self.calls, "coalesced": self.coalesced}
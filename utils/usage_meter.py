@@ -0,0 +1,205 @@
+# --------------------------------------------------------------------------------
+# Учёт токенов и стоимости обращений к LLM
+# --------------------------------------------------------------------------------
+# Импорты
+# --------------------------------------------------------------------------------
+
+
+import os
+import csv
+import sys
+import time
+import sqlite3
+import threading
+
+from datetime import datetime
+from typing import Callable
+from dataclasses import dataclass, asdict
+
+
+# --------------------------------------------------------------------------------
+# Исключения
+# --------------------------------------------------------------------------------
+
+
+class BudgetExceededError(Exception):
+    """Пользователь исчерпал дневной лимит токенов"""
+
+
+# --------------------------------------------------------------------------------
+# Дата классы
+# --------------------------------------------------------------------------------
+
+
+@dataclass
+class Usage:
+    """Расход одного обращения к LLM"""
+    kind: str  # invoke — сообщение агенту, upload — загрузка файла
+    prompt_tokens: int = 0  # токены запроса, включая вложения
+    completion_tokens: int = 0  # токены ответа
+    precached_tokens: int = 0  # токены запроса, взятые из кэша GigaChat
+    attachments: int = 0  # количество вложений
+    attachment_bytes: int = 0  # размер загруженных файлов
+    steps: int = 0  # количество шагов агента (ответов модели)
+    latency_ms: int = 0  # время ответа
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+def usage_from_messages(messages: list, attachments: int = 0, latency_ms: int = 0) -> Usage:
+    """Суммирует расход по всем ответам модели из переданных сообщений одного вызова"""
+    usage = Usage(kind="invoke", attachments=attachments, latency_ms=latency_ms)
+
+    for message in messages:
+        if getattr(message, "type", None) != "ai":
+            continue
+
+        usage.steps += 1
+        metadata = getattr(message, "usage_metadata", None) or {}
+        usage.prompt_tokens += metadata.get("input_tokens", 0)
+        usage.completion_tokens += metadata.get("output_tokens", 0)
+
+        token_usage = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+        if isinstance(token_usage, dict):
+            usage.precached_tokens += token_usage.get("precached_prompt_tokens") or 0
+        else:
+            usage.precached_tokens += getattr(token_usage, "precached_prompt_tokens", 0) or 0
+
+    return usage
+
+
+# --------------------------------------------------------------------------------
+# Хранилище
+# --------------------------------------------------------------------------------
+
+
+FIELDS = [
+    "ts", "user_id", "session_id", "document_id", "kind",
+    "prompt_tokens", "completion_tokens", "precached_tokens",
+    "attachments", "attachment_bytes", "steps", "latency_ms",
+]
+
+
+class UsageMeter:
+    """
+    Складывает расход каждого обращения в локальную SQLite-базу
+    и агрегирует его по пользователю, FSM-сессии и документу.
+    daily_budget — лимит токенов на пользователя в сутки, 0 — без лимита.
+    Запись идёт и из потоков агента, поэтому соединение защищено блокировкой.
+    """
+
+    def __init__(self, db_path: str, daily_budget: int = 0):
+        self._daily_budget = daily_budget
+
+        folder = os.path.dirname(db_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS usage (
+                ts REAL NOT NULL,
+                user_id INTEGER NOT NULL,
+                session_id TEXT,
+                document_id TEXT,
+                kind TEXT NOT NULL,
+                prompt_tokens INTEGER NOT NULL,
+                completion_tokens INTEGER NOT NULL,
+                precached_tokens INTEGER NOT NULL,
+                attachments INTEGER NOT NULL,
+                attachment_bytes INTEGER NOT NULL,
+                steps INTEGER NOT NULL,
+                latency_ms INTEGER NOT NULL
+            )
+            """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS usage_user_ts ON usage (user_id, ts)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS usage_session ON usage (session_id)")
+        self._db.commit()
+
+    def record(self, usage: Usage, user_id: int, session_id: str | None = None, document_id: str | None = None) -> None:
+        row = {"ts": time.time(), "user_id": user_id, "session_id": session_id, "document_id": document_id, **asdict(usage)}
+        with self._lock:
+            self._db.execute(
+                f"INSERT INTO usage ({', '.join(FIELDS)}) VALUES ({', '.join('?' * len(FIELDS))})",
+                [row[field] for field in FIELDS],
+            )
+            self._db.commit()
+
+    def recorder(self, user_id: int, session_id: str | None = None) -> Callable[[Usage], None]:
+        """Колбэк для агента: записывает расход каждого завершившегося вызова"""
+        return lambda usage: self.record(usage, user_id, session_id)
+
+    def assign_document(self, session_id: str, document_id: str) -> None:
+        """Относит весь ещё не распределённый расход сессии к созданному документу"""
+        with self._lock:
+            self._db.execute(
+                "UPDATE usage SET document_id = ? WHERE session_id = ? AND document_id IS NULL",
+                (document_id, session_id),
+            )
+            self._db.commit()
+
+    def tokens_today(self, user_id: int) -> int:
+        day_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+        with self._lock:
+            (tokens,) = self._db.execute(
+                "SELECT COALESCE(SUM(prompt_tokens + completion_tokens), 0) FROM usage WHERE user_id = ? AND ts >= ?",
+                (user_id, day_start),
+            ).fetchone()
+        return tokens
+
+    def check_budget(self, user_id: int) -> None:
+        """Вызывается до обращения к LLM, чтобы не начинать дорогую работу сверх лимита"""
+        if self._daily_budget and self.tokens_today(user_id) >= self._daily_budget:
+            raise BudgetExceededError()
+
+    def totals(self, group_by: str) -> list[dict]:
+        """Сводка по user_id, session_id или document_id"""
+        if group_by not in ("user_id", "session_id", "document_id"):
+            raise ValueError(f"unknown group_by: {group_by}")
+
+        with self._lock:
+            cursor = self._db.execute(
+                f"""
+            SELECT {group_by},
+                   COUNT(*) AS calls,
+                   SUM(prompt_tokens) AS prompt_tokens,
+                   SUM(completion_tokens) AS completion_tokens,
+                   SUM(precached_tokens) AS precached_tokens,
+                   SUM(attachments) AS attachments,
+                   SUM(attachment_bytes) AS attachment_bytes,
+                   SUM(latency_ms) AS latency_ms
+            FROM usage
+            WHERE {group_by} IS NOT NULL
+            GROUP BY {group_by}
+            ORDER BY SUM(prompt_tokens + completion_tokens) DESC
+            """
+            )
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def export_csv(self, path: str) -> None:
+        """Выгружает все записи в CSV для планирования нагрузки"""
+        with self._lock:
+            rows = self._db.execute(f"SELECT {', '.join(FIELDS)} FROM usage ORDER BY ts").fetchall()
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(FIELDS)
+            writer.writerows(rows)
+
+
+# --------------------------------------------------------------------------------
+# Выгрузка из командной строки: python -m utils.usage_meter <db_path> <csv_path>
+# --------------------------------------------------------------------------------
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("usage: python -m utils.usage_meter <db_path> <csv_path>")
+        sys.exit(1)
+
+    UsageMeter(sys.argv[1]).export_csv(sys.argv[2])